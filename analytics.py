@@ -1,11 +1,111 @@
+import html
+import itertools
 import json
 import os
 import re
 from collections import Counter
-from threading import Lock
-from urllib.parse import urlparse
-
-from bs4 import BeautifulSoup
+from queue import Queue
+from threading import Lock, Thread, local
+
+from lxml import etree
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Byte translation table for tokenizing: A-Z fold to a-z, a-z and 0-9 are
+# kept, and every other byte becomes a space so str.split() yields the
+# alphanumeric runs.
+_WORD_BYTES = b'abcdefghijklmnopqrstuvwxyz0123456789'
+_TOKEN_TABLE = bytes(
+    b if b in _WORD_BYTES else b + 32 if 65 <= b <= 90 else 32
+    for b in range(256)
+)
+
+# Markup removed before counting words: comments and script/style/noscript
+# bodies first, then every remaining tag.
+_DROP_RE = re.compile(
+    rb'<!--.*?-->|<(script|style|noscript)\b[^>]*>.*?</\1\s*>', re.I | re.S)
+_TAG_RE = re.compile(rb'<[^>]+>')
+
+# Network location of an http(s) URL, without a full urlparse.
+_NETLOC_RE = re.compile(r'https?://([^/?#]+)', re.I)
+
+# Common English stop words excluded from the word counts.
+_STOPWORDS = frozenset({
+    'a', 'about', 'above', 'after', 'again', 'against', 'all', 'am', 'an',
+    'and', 'any', 'are', 'as', 'at', 'be', 'because', 'been', 'before',
+    'being', 'below', 'between', 'both', 'but', 'by', 'can', 'could',
+    'did', 'do', 'does', 'doing', 'down', 'during', 'each', 'few', 'for',
+    'from', 'further', 'had', 'has', 'have', 'having', 'he', 'her', 'here',
+    'hers', 'herself', 'him', 'himself', 'his', 'how', 'i', 'if', 'in',
+    'into', 'is', 'it', 'its', 'itself', 'just', 'me', 'might', 'more',
+    'most', 'must', 'my', 'myself', 'no', 'nor', 'not', 'now', 'of', 'off',
+    'on', 'once', 'only', 'or', 'other', 'our', 'ours', 'ourselves', 'out',
+    'over', 'own', 's', 'same', 'she', 'should', 'so', 'some', 'such',
+    't', 'than', 'that', 'the', 'their', 'theirs', 'them', 'themselves',
+    'then', 'there', 'these', 'they', 'this', 'those', 'through', 'to',
+    'too', 'under', 'until', 'up', 'very', 'was', 'we', 'were', 'what',
+    'when', 'where', 'which', 'while', 'who', 'whom', 'why', 'will', 'with',
+    'would', 'you', 'your', 'yours', 'yourself', 'yourselves'
+})
+
+# Words left out of the counts: stop words and single characters.
+_EXCLUDED_WORDS = _STOPWORDS | frozenset('abcdefghijklmnopqrstuvwxyz0123456789')
+
+
+def _json_dumps(data, indent=False):
+    """Serialize data to UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(data, indent=2 if indent else None,
+                      ensure_ascii=False).encode('utf-8')
+
+
+def _json_loads(data):
+    """Parse JSON text or bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class _TextTarget:
+    """lxml parser target that keeps text outside script/style/noscript."""
+
+    SKIP = frozenset({"script", "style", "noscript"})
+
+    def __init__(self):
+        self.depth = 0
+        self.parts = []
+
+    def start(self, tag, attrib):
+        if tag in self.SKIP:
+            self.depth += 1
+        # Tags separate words; text within one node may arrive in pieces.
+        self.parts.append(' ')
+
+    def end(self, tag):
+        if tag in self.SKIP:
+            self.depth -= 1
+        self.parts.append(' ')
+
+    def data(self, data):
+        if not self.depth:
+            self.parts.append(data)
+
+    def close(self):
+        return ''.join(self.parts)
+
+
+class _LocalTally:
+    """Word and subdomain counts collected by a single worker thread."""
+
+    def __init__(self):
+        # Only contended while the totals are being folded together.
+        self.lock = Lock()
+        self.words = Counter()
+        self.subdomains = Counter()
 
 
 class CrawlerAnalytics:
@@ -13,14 +113,26 @@ class CrawlerAnalytics:
 
     def __init__(self, save_file="analytics_data.json"):
         self.save_file = save_file
+        self.log_file = save_file + ".log"
         self.lock = Lock()
 
         self.unique_pages = set()
         self.word_counter = Counter()
-        self.longest_page = {"url": "", "word_count": 0}
+        # (word_count, url); replaced whole, so reads and writes need no lock
+        self._longest = (0, "")
         self.subdomain_counter = Counter()
 
+        # Per-thread counts, folded into the counters above on save/report
+        self._tls = local()
+        self._tallies = []
+
+        # Changes since the last checkpoint, appended to the log as one record
+        self._new_pages = []
+        self._word_delta = Counter()
+        self._subdomain_delta = Counter()
+
         self._load_data()
+        self._log = open(self.log_file, 'ab', buffering=65536)
 
     def process_page(self, url, html_text):
         """
@@ -30,81 +142,141 @@ class CrawlerAnalytics:
             url: The URL of the page
             html_text: The HTML content of the page
         """
-        with self.lock:
-            self.unique_pages.add(url)
+        subdomain = self._extract_subdomain(url)
+        text = self._extract_text_from_html(html_text)
 
-            subdomain = self._extract_subdomain(url)
-            if subdomain:
-                self.subdomain_counter[subdomain] += 1
+        word_count, page_words = self._count_words(text)
 
-            text = self._extract_text_from_html(html_text)
-            words = self._tokenize(text)
-            word_count = len(words)
+        tally = self._local_tally()
+        with tally.lock:
+            if subdomain:
+                tally.subdomains[subdomain] += 1
+            tally.words.update(page_words)
 
-            if word_count > self.longest_page["word_count"]:
-                self.longest_page = {"url": url, "word_count": word_count}
+        # Tuple reads and assignments are atomic under the GIL. Two threads
+        # beating the maximum at the same instant may lose one update, which
+        # is acceptable for this statistic.
+        if word_count > self._longest[0]:
+            self._longest = (word_count, url)
 
-            filtered_words = self._filter_stopwords(words)
-            self.word_counter.update(filtered_words)
+        with self.lock:
+            if url not in self.unique_pages:
+                self.unique_pages.add(url)
+                self._new_pages.append(url)
+
+    @property
+    def longest_page(self):
+        """The longest page seen so far, as saved to disk."""
+        word_count, url = self._longest
+        return {"url": url, "word_count": word_count}
+
+    def _set_longest_page(self, longest_page):
+        self._longest = (longest_page["word_count"], longest_page["url"])
+
+    def _local_tally(self):
+        """Return the calling thread's tally, registering it on first use."""
+        tally = getattr(self._tls, "tally", None)
+        if tally is None:
+            tally = _LocalTally()
+            with self.lock:
+                self._tallies.append(tally)
+            self._tls.tally = tally
+        return tally
+
+    def _fold_tallies(self):
+        """Move per-thread counts into the totals. Caller must hold self.lock."""
+        for tally in self._tallies:
+            with tally.lock:
+                self.word_counter.update(tally.words)
+                self.subdomain_counter.update(tally.subdomains)
+                self._word_delta.update(tally.words)
+                self._subdomain_delta.update(tally.subdomains)
+                tally.words.clear()
+                tally.subdomains.clear()
 
     def _extract_subdomain(self, url):
         """Extract subdomain from URL if it's a uci.edu domain."""
-        try:
-            parsed = urlparse(url)
-            netloc = parsed.netloc.lower()
+        match = _NETLOC_RE.match(url)
+        if not match:
+            return None
 
-            if netloc.endswith('.uci.edu'):
-                return netloc
+        netloc = match.group(1).lower()
+        if netloc.endswith('.uci.edu'):
+            return netloc
 
-            return None
-        except Exception:
-            return None
+        return None
 
     def _extract_text_from_html(self, html_text):
         """Extract visible text from HTML, removing markup."""
+        # Word counting needs no DOM: strip markup with two byte-level scans
+        # and decode entities on what is left.
         try:
-            soup = BeautifulSoup(html_text, 'lxml')
+            raw = html_text.encode('utf-8') if isinstance(html_text, str) else html_text
+            raw = _DROP_RE.sub(b' ', raw)
+            raw = _TAG_RE.sub(b' ', raw)
+            return html.unescape(raw.decode('utf-8', 'ignore'))
         except Exception:
-            soup = BeautifulSoup(html_text, 'html.parser')
-
-        # Remove script and style elements
-        for script in soup(["script", "style", "meta", "link", "noscript"]):
-            script.decompose()
-
-        # Get text
-        text = soup.get_text(separator=' ', strip=True)
-        return text
+            return self._parse_text_from_html(html_text)
+
+    def _parse_text_from_html(self, html_text):
+        """Extract visible text with a real HTML parser."""
+        if isinstance(html_text, str):
+            html_text = html_text.encode('utf-8', 'replace')
+        parser = etree.HTMLParser(
+            target=_TextTarget(), encoding='utf-8', recover=True)
+        try:
+            return etree.fromstring(html_text, parser)
+        except (etree.LxmlError, ValueError):
+            return ''
 
     def _tokenize(self, text):
         """Tokenize text into words (alphanumeric sequences)."""
-        # Extract words: sequences of alphanumeric characters
-        words = re.findall(r'\b[a-z0-9]+\b', text.lower())
-        return words
-
-    def _filter_stopwords(self, words):
-        """Remove common English stop words."""
-        stopwords = {
-            'a', 'about', 'above', 'after', 'again', 'against', 'all', 'am', 'an',
-            'and', 'any', 'are', 'as', 'at', 'be', 'because', 'been', 'before',
-            'being', 'below', 'between', 'both', 'but', 'by', 'can', 'could',
-            'did', 'do', 'does', 'doing', 'down', 'during', 'each', 'few', 'for',
-            'from', 'further', 'had', 'has', 'have', 'having', 'he', 'her', 'here',
-            'hers', 'herself', 'him', 'himself', 'his', 'how', 'i', 'if', 'in',
-            'into', 'is', 'it', 'its', 'itself', 'just', 'me', 'might', 'more',
-            'most', 'must', 'my', 'myself', 'no', 'nor', 'not', 'now', 'of', 'off',
-            'on', 'once', 'only', 'or', 'other', 'our', 'ours', 'ourselves', 'out',
-            'over', 'own', 's', 'same', 'she', 'should', 'so', 'some', 'such',
-            't', 'than', 'that', 'the', 'their', 'theirs', 'them', 'themselves',
-            'then', 'there', 'these', 'they', 'this', 'those', 'through', 'to',
-            'too', 'under', 'until', 'up', 'very', 'was', 'we', 'were', 'what',
-            'when', 'where', 'which', 'while', 'who', 'whom', 'why', 'will', 'with',
-            'would', 'you', 'your', 'yours', 'yourself', 'yourselves'
-        }
-        return [w for w in words if w not in stopwords and len(w) > 1]
-
-    def save(self):
-        """Save analytics data to disk."""
+        # Non-ASCII characters encode to '?', which the table turns into a
+        # separator. This gives the [a-z0-9]+ runs of the lowercased text,
+        # except for the few non-ASCII letters whose Unicode lowercase is
+        # ASCII (e.g. the Kelvin sign, or the 'i' of U+0130); these now
+        # split words instead of joining them.
+        ascii_text = text.encode('ascii', 'replace').translate(_TOKEN_TABLE)
+        return ascii_text.decode('ascii').split()
+
+    def _count_words(self, text):
+        """
+        Count the words of a page.
+
+        Returns:
+            Tuple of (total word count, Counter of words excluding stop words)
+        """
+        words = self._tokenize(text)
+        # Counting every token and then dropping the excluded keys keeps the
+        # per-token work inside C; only the page's distinct words are touched.
+        counts = Counter(words)
+        for word in _EXCLUDED_WORDS.intersection(counts):
+            del counts[word]
+        return len(words), counts
+
+    def checkpoint(self):
+        """Append the changes since the last checkpoint to the analytics log."""
         with self.lock:
+            self._fold_tallies()
+            if not (self._new_pages or self._word_delta or self._subdomain_delta):
+                return
+            record = {
+                "pages": self._new_pages,
+                "words": self._word_delta,
+                "subdomains": self._subdomain_delta,
+                "longest_page": self.longest_page,
+            }
+            self._log.write(_json_dumps(record) + b"\n")
+            self._log.flush()
+
+            self._new_pages = []
+            self._word_delta = Counter()
+            self._subdomain_delta = Counter()
+
+    def dump_snapshot(self):
+        """Write the full analytics snapshot to the JSON save file."""
+        with self.lock:
+            self._fold_tallies()
             data = {
                 "unique_pages": list(self.unique_pages),
                 "unique_page_count": len(self.unique_pages),
@@ -113,20 +285,24 @@ class CrawlerAnalytics:
                 "subdomain_counts": dict(self.subdomain_counter)
             }
 
-            with open(self.save_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            with open(self.save_file, 'wb') as f:
+                f.write(_json_dumps(data, indent=True))
 
     def _load_data(self):
         """Load analytics data from disk if it exists."""
+        if os.path.exists(self.log_file):
+            self._replay_log()
+            return
         if not os.path.exists(self.save_file):
             return
 
         try:
-            with open(self.save_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(self.save_file, 'rb') as f:
+                data = _json_loads(f.read())
 
             self.unique_pages = set(data.get("unique_pages", []))
-            self.longest_page = data.get("longest_page", {"url": "", "word_count": 0})
+            self._set_longest_page(
+                data.get("longest_page", {"url": "", "word_count": 0}))
 
             # Restore word counter
             top_words = data.get("top_50_words", [])
@@ -137,10 +313,39 @@ class CrawlerAnalytics:
             self.subdomain_counter = Counter(subdomain_data)
         except Exception as e:
             print(f"Warning: Could not load analytics data: {e}")
+            return
+
+        # No log yet: the first checkpoint carries the snapshot as its base.
+        self._new_pages = list(self.unique_pages)
+        self._word_delta = Counter(self.word_counter)
+        self._subdomain_delta = Counter(self.subdomain_counter)
+
+    def _replay_log(self):
+        """Rebuild analytics state from the checkpoint log."""
+        good_offset = 0
+        with open(self.log_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = _json_loads(line)
+                except ValueError:
+                    break
+                self.unique_pages.update(record["pages"])
+                self.word_counter.update(record["words"])
+                self.subdomain_counter.update(record["subdomains"])
+                self._set_longest_page(record["longest_page"])
+                good_offset += len(line)
+
+        # Drop a record left half-written by a crash so appends stay parseable
+        if good_offset < os.path.getsize(self.log_file):
+            print("Warning: Discarding incomplete analytics log record")
+            os.truncate(self.log_file, good_offset)
 
     def get_report(self):
         """Generate a formatted report string."""
         with self.lock:
+            self._fold_tallies()
             lines = []
             lines.append("=" * 70)
             lines.append("WEB CRAWLER ANALYTICS REPORT")
@@ -153,8 +358,9 @@ class CrawlerAnalytics:
 
             # 2. Longest page
             lines.append(f"2. Longest Page (by word count):")
-            lines.append(f"   URL: {self.longest_page['url']}")
-            lines.append(f"   Word Count: {self.longest_page['word_count']:,}")
+            word_count, url = self._longest
+            lines.append(f"   URL: {url}")
+            lines.append(f"   Word Count: {word_count:,}")
             lines.append("")
 
             # 3. Top 50 common words
@@ -190,6 +396,15 @@ class CrawlerAnalytics:
 _analytics_instance = None
 _analytics_lock = Lock()
 
+# Analytics are checkpointed to disk every _FETCH_THRESHOLD tracked pages.
+# next() on itertools.count is atomic under the GIL, so no lock is needed.
+_FETCH_THRESHOLD = 50
+_fetch_counter = itertools.count(1)
+
+# Pages waiting for the analytics thread. Bounded, so crawler threads block
+# rather than buffer the crawl if analytics falls behind.
+_page_queue = Queue(maxsize=256)
+
 
 def get_analytics():
     """Get the global analytics instance (thread-safe singleton)."""
@@ -198,24 +413,43 @@ def get_analytics():
         with _analytics_lock:
             if _analytics_instance is None:
                 _analytics_instance = CrawlerAnalytics()
+                Thread(target=_consume_pages, args=(_analytics_instance,),
+                       daemon=True).start()
     return _analytics_instance
 
 
+def _consume_pages(analytics):
+    """Process queued pages off the crawler threads."""
+    while True:
+        url, html_text = _page_queue.get()
+        try:
+            analytics.process_page(url, html_text)
+            if next(_fetch_counter) % _FETCH_THRESHOLD == 0:
+                analytics.checkpoint()
+        except Exception as e:
+            print(f"Warning: Could not process analytics for {url}: {e}")
+        finally:
+            _page_queue.task_done()
+
+
 def track_page(url, html_text):
-    """Convenience function to track a page."""
-    analytics = get_analytics()
-    analytics.process_page(url, html_text)
+    """Convenience function to queue a page for analytics."""
+    get_analytics()
+    _page_queue.put((url, html_text))
 
 
 def save_analytics():
     """Convenience function to save analytics data."""
     analytics = get_analytics()
-    analytics.save()
+    _page_queue.join()
+    analytics.checkpoint()
 
 
 def generate_report():
     """Convenience function to generate and save the report."""
     analytics = get_analytics()
+    _page_queue.join()
     analytics.print_report()
     analytics.save_report()
-    analytics.save()
+    analytics.checkpoint()
+    analytics.dump_snapshot()
@@ -1,27 +1,47 @@
+import atexit
 import os
-import shelve
 import sqlite3
 
-from threading import Thread, RLock
+from collections import deque
+from functools import lru_cache
+from threading import Thread, Lock, Event
 from queue import Queue, Empty
 
 from utils import get_logger, get_urlhash, normalize
 from scraper import is_valid
 
-_original_connect = sqlite3.connect
+# Pending writes are persisted every FLUSH_INTERVAL seconds, or as soon as
+# FLUSH_BATCH of them have queued up, instead of syncing on every change.
+# Anything still pending is written at exit; a crash only loses the last few
+# seconds, which at worst re-downloads urls completed in that window.
+FLUSH_INTERVAL = 5.0
+FLUSH_BATCH = 256
+# Seen urls are split over SHARD_COUNT dicts, each behind its own lock, so
+# workers adding or completing different urls rarely wait on each other.
+SHARD_COUNT = 16
 
-def _patched_connect(*args, **kwargs):
-    kwargs['check_same_thread'] = False
-    return _original_connect(*args, **kwargs)
 
-sqlite3.connect = _patched_connect
+@lru_cache(maxsize=65536)
+def _canonical(url):
+    ''' Normalized url and its hash; cached since popular links repeat a lot. '''
+    url = normalize(url)
+    return url, get_urlhash(url)
+
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
-        
+        self.to_be_downloaded = deque()
+        self._qlock = Lock()
+        # In-memory mirror of the save file: urlhash -> (url, completed),
+        # sharded by urlhash.
+        self._shards = [(dict(), Lock()) for _ in range(SHARD_COUNT)]
+        self._pending = list()
+        self._pending_lock = Lock()
+        self._flush_now = Event()
+        self._save_lock = Lock()
+
         if not os.path.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
@@ -31,24 +51,44 @@ class Frontier(object):
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.config.save_file + suffix):
+                    os.remove(self.config.save_file + suffix)
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        self.save = self._open_save_file(self.config.save_file)
         if restart:
             for url in self.config.seed_urls:
                 self.add_url(url)
         else:
             # Set the frontier state with contents of save file.
             self._parse_save_file()
-            if not self.save:
+            if not any(urls for urls, _ in self._shards):
                 for url in self.config.seed_urls:
                     self.add_url(url)
+        self._flusher = Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def _open_save_file(self, save_file):
+        save = sqlite3.connect(
+            save_file, isolation_level=None, check_same_thread=False)
+        save.execute("PRAGMA journal_mode=WAL")
+        save.execute("PRAGMA synchronous=NORMAL")
+        save.execute("PRAGMA temp_store=MEMORY")
+        save.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "hash TEXT PRIMARY KEY, url TEXT NOT NULL, completed INTEGER NOT NULL)")
+        return save
 
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
-        total_count = len(self.save)
+        total_count = 0
         tbd_count = 0
-        for url, completed in self.save.values():
+        for urlhash, url, completed in self.save.execute(
+                "SELECT hash, url, completed FROM urls"):
+            urls, _ = self._shard(urlhash)
+            urls[urlhash] = (url, bool(completed))
+            total_count += 1
             if not completed and is_valid(url):
                 self.to_be_downloaded.append(url)
                 tbd_count += 1
@@ -56,26 +96,75 @@ class Frontier(object):
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
 
+    def _shard(self, urlhash):
+        return self._shards[hash(urlhash) & (SHARD_COUNT - 1)]
+
     def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+        with self._qlock:
+            try:
+                return self.to_be_downloaded.pop()
+            except IndexError:
+                return None
 
     def add_url(self, url):
-        url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
+        url, urlhash = _canonical(url)
+        urls, lock = self._shard(urlhash)
+        with lock:
+            if urlhash in urls:
+                return
+            urls[urlhash] = (url, False)
+            self._queue_write(urlhash, url, False)
+        with self._qlock:
             self.to_be_downloaded.append(url)
-    
+
     def mark_url_complete(self, url):
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
+        urls, lock = self._shard(urlhash)
+        with lock:
+            if urlhash not in urls:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            urls[urlhash] = (url, True)
+            self._queue_write(urlhash, url, True)
+
+    def _queue_write(self, urlhash, url, completed):
+        # Called under the url's shard lock so writes for one url stay ordered.
+        with self._pending_lock:
+            self._pending.append((urlhash, url, int(completed)))
+            if len(self._pending) >= FLUSH_BATCH:
+                self._flush_now.set()
+
+    def _flush_loop(self):
+        while True:
+            self._flush_now.wait(FLUSH_INTERVAL)
+            self._flush_now.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Keep flushing; the batch stays pending for the next try.
+                self.logger.exception("Unexpected error saving frontier.")
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+    def flush(self):
+        ''' Write all pending url updates to the save file in one transaction. '''
+        with self._save_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, list()
+            if not pending:
+                return
+            try:
+                self.save.execute("BEGIN")
+                self.save.executemany(
+                    "INSERT OR REPLACE INTO urls (hash, url, completed) "
+                    "VALUES (?, ?, ?)", pending)
+                self.save.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self.save.in_transaction:
+                    self.save.execute("ROLLBACK")
+                # Put the batch back ahead of newer updates so they still
+                # win when it is retried.
+                with self._pending_lock:
+                    self._pending[:0] = pending
+                self.logger.error(
+                    f"Failed to save {len(pending)} url updates: {e}")
@@ -1,12 +1,36 @@
-from threading import Thread
+from threading import Lock, Thread
 
 from inspect import getsource
+from urllib.parse import urlparse
 from utils.download import download
 from utils import get_logger
 import scraper
 import time
 from scraper import retrieve_text, store_document
-from similarity import SimilarityTracker
+from similarity import get_similarity_tracker
+
+# basic check for requests in scraper, done once rather than per worker
+_SCRAPER_SOURCE = getsource(scraper)
+assert {_SCRAPER_SOURCE.find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
+assert {_SCRAPER_SOURCE.find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
+
+# Earliest time.monotonic() at which each domain may be requested again,
+# striped over _POLITE_SHARDS locks so workers on different domains rarely
+# contend.
+_POLITE_SHARDS = 16
+_domain_times = [(dict(), Lock()) for _ in range(_POLITE_SHARDS)]
+
+
+def get_polite(url, time_delay):
+    """Reserve the next request slot for url's domain and wait until it."""
+    domain = urlparse(url).netloc.lower()
+    next_times, lock = _domain_times[hash(domain) & (_POLITE_SHARDS - 1)]
+    with lock:
+        now = time.monotonic()
+        next_ok = max(now, next_times.get(domain, 0))
+        # Set before sleeping, so concurrent workers get disjoint slots
+        next_times[domain] = next_ok + time_delay
+    time.sleep(next_ok - now)
 
 
 class Worker(Thread):
@@ -14,10 +38,7 @@ class Worker(Thread):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
-        # basic check for requests in scraper
-        self.similarity_tracker = SimilarityTracker(exact_threshold=1.0, near_threshold=0.88)
-        assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
-        assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
+        self.similarity_tracker = get_similarity_tracker()
         super().__init__(daemon=True)
         
     def run(self):
@@ -26,6 +47,7 @@ class Worker(Thread):
             if not tbd_url:
                 self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
+            get_polite(tbd_url, self.config.time_delay)
             resp = download(tbd_url, self.config, self.logger)
             self.logger.info(...)
             
@@ -45,4 +67,3 @@ class Worker(Thread):
                 self.logger.info(f"Skipped {detection_method} duplicate: {tbd_url}")
             
             self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
@@ -1,10 +1,12 @@
 from configparser import ConfigParser
 from argparse import ArgumentParser
+import os
 
 from utils.server_registration import get_cache_server
 from utils.config import Config
 from crawler import Crawler
 from analytics import save_analytics, generate_report
+from similarity import get_similarity_tracker
 import multiprocessing
 import sys
 
@@ -21,6 +23,10 @@ def main(config_file, restart):
     cparser.read(config_file)
     config = Config(cparser)
     config.cache_server = get_cache_server(config, restart)
+    # Created here so --restart, or a deleted save file, also clears the
+    # saved page fingerprints.
+    get_similarity_tracker(
+        restart=restart or not os.path.exists(config.save_file))
     crawler = Crawler(config, restart)
     crawler.start()
 
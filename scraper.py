@@ -1,3 +1,4 @@
+import atexit
 import configparser
 import datetime as _dt
 import gzip
@@ -5,20 +6,110 @@ import json
 import logging
 import os
 import re
-from html.parser import HTMLParser
+import sys
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+from queue import Empty, Queue
+from threading import Lock, Thread, local
 from types import SimpleNamespace
-from urllib.parse import parse_qs, urljoin, urldefrag, urlparse
+from urllib.parse import parse_qsl, quote, unquote, urljoin, urlparse, urlunparse
 from urllib.robotparser import RobotFileParser
 
-from bs4 import BeautifulSoup
+from lxml import etree
 from utils.config import Config
 from utils.download import download
 from utils.server_registration import get_cache_server
 from analytics import track_page
 
-_ROBOTS_CACHE = {}
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Robots rules per scheme://netloc, least recently used first:
+# key -> (_RobotRules or None to allow all, expiry in time.monotonic()).
+# Hosts whose robots.txt could not be fetched are retried sooner.
+_ROBOTS_CACHE = OrderedDict()
+_ROBOTS_LOCK = Lock()
+_ROBOTS_TTL = 6 * 3600
+_ROBOTS_NEGATIVE_TTL = 30 * 60
+_ROBOTS_MAX = 4096
+# Only the first 512 KiB of a robots.txt is parsed, as Google does.
+_ROBOTS_MAX_BYTES = 512 * 1024
 _CACHE_SERVER = None
 
+# Current part file per source directory, kept across store_records calls
+# so each record is not a fresh gzip stream. Every _PART_FLUSH_EVERY records
+# the gzip member is ended, so a crash loses at most that many records and
+# never leaves a torn member behind. At most _MAX_OPEN_PARTS parts hold an
+# open handle, least recently written first; idle ones are closed.
+_PARTS = {}
+_OPEN_PARTS = OrderedDict()
+_PARTS_LOCK = Lock()
+_PART_FLUSH_EVERY = 256
+_MAX_OPEN_PARTS = 32
+
+# Records waiting for the writer thread, which does the JSON encoding,
+# compression and disk writes off the crawler threads. Bounded, so workers
+# block rather than buffer pages if the disk falls behind.
+_record_queue = Queue(maxsize=1024)
+_writer_thread = None
+_writer_lock = Lock()
+_WRITE_BATCH = 64
+
+# URL filters, compiled once at import since they run on every discovered link.
+_ALLOWED_NETLOC_RE = re.compile(r".*\.(ics|cs|informatics|stat)\.uci\.edu$")
+_DISALLOWED_EXTS = frozenset({
+    "css", "js", "bmp", "gif", "jpg", "jpeg", "ico",
+    "png", "tif", "tiff", "mid", "mp2", "mp3", "mp4",
+    "wav", "avi", "mov", "mpeg", "ram", "m4v", "mkv", "ogg", "ogv", "pdf",
+    "ps", "eps", "tex", "ppt", "pptx", "doc", "docx", "xls", "xlsx", "names",
+    "data", "dat", "exe", "bz2", "tar", "msi", "bin", "7z", "psd", "dmg", "iso",
+    "epub", "dll", "cnf", "tgz", "sha1",
+    "thmx", "mso", "arff", "rtf", "jar", "csv",
+    "rm", "smil", "wmv", "swf", "wma", "zip", "rar", "gz",
+})
+
+_DATE_PATTERNS = [
+    re.compile(r"/(19|20)\d{2}/\d{1,2}/\d{1,2}/"),  # /YYYY/MM/DD/
+    re.compile(r"/(19|20)\d{2}-\d{1,2}-\d{1,2}/"),  # /YYYY-MM-DD/
+    re.compile(r"[?&](date|day|month|year)=\d{4}[-/]\d{1,2}[-/]\d{1,2}"),  # ?date=YYYY-MM-DD
+]
+_YEAR_RE = re.compile(r"(19|20)\d{2}")
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_TRAP_QUERY_KEY_RE = re.compile(r"(calendar|ical|feed|rss|atom)")
+# Calendar archive traps that need a pattern, as one alternation so a path
+# is scanned once; the literal ones are plain substring checks in is_trap.
+_EVENT_TRAP_RE = re.compile(
+    r"/events/\d{4}-\d{2}-\d{2}$"
+    r"|/events/.*/day/\d{4}-\d{2}-\d{2}"
+    r"|/events/tag/[^/]+/\d{4}-\d{2}$"
+    r"|/events/tag/[^/]+/list(?:/|$)"
+)
+# Month and list views (this covers month/YYYY-MM and list/page/N too)
+_EVENT_VIEW_DIRS = ("/events/month/", "/events/list/")
+_EVENT_VIEW_ENDS = ("/events/month", "/events/list", "/events/today", "/events/today/")
+_LIB_EXE_PAGES = ("/lib/exe/fetch.php", "/lib/exe/detail.php")
+
+_LARGE_PAGINATION_KEYS = frozenset({"page", "p", "start", "offset"})
+_ICAL_KEYS = frozenset({"ical", "outlook-ical", "icalendar", "format"})
+_TRACKING_KEYS = frozenset({
+    "sessionid", "sid", "phpsessid", "jsessionid", "ref",
+    "utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content",
+    "gclid", "fbclid",
+})
+_EVENT_QUERY_KEYS = frozenset({"tribe-bar-date", "eventdisplay", "tribe_event", "eventdate"})
+_DOKU_TRAP_KEYS = frozenset({
+    "do", "idx", "rev", "rev2", "difftype", "sectok",
+    "tab_files", "tab_details",
+})
+_MEDIA_QUERY_KEYS = frozenset({"image", "media", "tab_files", "tab_details", "sectok"})
+# Query keys that mark a url as a trap on their own
+_TRAP_QUERY_KEYS = _ICAL_KEYS | _TRACKING_KEYS | _EVENT_QUERY_KEYS | _MEDIA_QUERY_KEYS
+_IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".bmp", ".ico", ".tiff")
+
 
 def _load_user_agent():
     config_path = os.path.join(os.path.dirname(__file__), "config.ini")
@@ -35,7 +126,12 @@ _USER_AGENT = _load_user_agent()
 
 def scraper(url, resp):
     links = extract_next_links(url, resp)
-    return [link for link in links if is_valid(link)]
+    # Navigation repeats links within a page, so drop duplicates (keeping
+    # order) before filtering. The same hrefs also turn up on many pages;
+    # interned copies hash and compare cheaply in the is_valid cache and
+    # the frontier.
+    return [link for link in dict.fromkeys(map(sys.intern, links))
+            if is_valid(link)]
 
 
 def extract_next_links(url, resp):
@@ -53,70 +149,139 @@ def extract_next_links(url, resp):
 
 def crawl_document(url, resp):
     """Main frame logic from the pseudocode."""
-    if not permits_crawl(url, resp):
+    # Parsed once and shared by the robots check and storage.
+    parsed = urlparse(url)
+    if not permits_crawl(url, resp, parsed):
         return []
     text = retrieve_text(url, resp)
     if text is None:
         return []
-    # Track page for analytics (saved at end of crawl)
+    # Track page for analytics (checkpointed every few pages)
     track_page(url, text)
-    store_document(url, text, resp=resp)
-    return parse_text_for_links(url, text)
+    store_document(url, text, resp=resp, parsed=parsed)
+    # lxml decodes the raw body itself; the str is only kept for storage.
+    return parse_text_for_links(
+        url, resp.raw_response.content, _response_encoding(resp))
 
 
-def permits_crawl(url, resp):
+def permits_crawl(url, resp, parsed=None):
     """Decide whether the retrieved URL should be processed."""
-    user_agent = _get_user_agent()
-    rp = _get_robot_parser(url)
-    if rp is None:
-        return True
-
-    if rp.disallow_all:
-        return False
-    elif rp.allow_all:
-        return True
-    elif _has_agent_rule(rp, user_agent):
-        return rp.can_fetch(user_agent, url)
-    elif _has_agent_rule(rp, "*"):
-        return rp.can_fetch("*", url)
-    else:
-        return True
+    rules = _get_robot_rules(url, parsed)
+    return rules is None or rules.can_fetch(url)
 
 
 def _get_user_agent():
     return _USER_AGENT
 
 
-def _get_robot_parser(url):
-    parsed = urlparse(url)
+class _RobotRules:
+    """The Allow/Disallow rules of one robots.txt group.
+
+    The first rule in file order whose path prefixes the url's path decides,
+    as in RobotFileParser. Paths are kept sorted so the rules that prefix
+    the path are found by bisection rather than by scanning every rule.
+    """
+
+    def __init__(self, rules):
+        # path -> (position in the file, allowed); a repeated path can
+        # never match before its first occurrence.
+        first = {}
+        for order, (path, allowed) in enumerate(rules):
+            first.setdefault(path, (order, allowed))
+        self.paths = sorted(first)
+        self.rules = [first[path] for path in self.paths]
+
+    @classmethod
+    def from_parser(cls, rp, user_agent):
+        """Rules that apply to user_agent, or None if everything is allowed."""
+        if rp.disallow_all:
+            return cls([("", False)])
+        if rp.allow_all:
+            return None
+        # The group RobotFileParser.can_fetch picks: the first naming us,
+        # else "User-agent: *", which it keeps in default_entry.
+        entry = next(
+            (entry for entry in rp.entries if entry.applies_to(user_agent)),
+            rp.default_entry)
+        if entry is None or not entry.rulelines:
+            return None
+        # RobotFileParser stores "*" as a match-everything path.
+        return cls(("" if line.path == "*" else line.path, line.allowance)
+                   for line in entry.rulelines)
+
+    def can_fetch(self, url):
+        # Normalize the path the same way RobotFileParser.can_fetch does.
+        parsed = urlparse(unquote(url))
+        path = quote(urlunparse(
+            ("", "", parsed.path, parsed.params, parsed.query, parsed.fragment)))
+        path = path or "/"
+
+        # Walk down the rules that prefix path, longest first, and keep the
+        # earliest in the file. Any shorter rule that prefixes path sorts
+        # before the one found and also prefixes what is left of path once
+        # it is cut to their common prefix, so search again below it.
+        first = None
+        hi = len(self.paths)
+        while hi:
+            i = bisect_right(self.paths, path, 0, hi)
+            if not i:
+                break
+            candidate = self.paths[i - 1]
+            if path.startswith(candidate):
+                rule = self.rules[i - 1]
+                if first is None or rule < first:
+                    first = rule
+                path = candidate[:-1]
+            else:
+                common = 0
+                while path[common] == candidate[common]:
+                    common += 1
+                path = path[:common]
+            hi = i - 1
+        return True if first is None else first[1]
+
+
+def _get_robot_rules(url, parsed=None):
+    """Return the robots rules that apply to us on the url's host."""
+    if parsed is None:
+        parsed = urlparse(url)
     if not parsed.scheme or not parsed.netloc:
         return None
     key = f"{parsed.scheme}://{parsed.netloc}"
-    if key in _ROBOTS_CACHE:
-        return _ROBOTS_CACHE[key]
-
+    now = time.monotonic()
+    with _ROBOTS_LOCK:
+        cached = _ROBOTS_CACHE.get(key)
+        if cached is not None:
+            rules, expires = cached
+            if now < expires:
+                _ROBOTS_CACHE.move_to_end(key)
+                return rules
+            del _ROBOTS_CACHE[key]
+
+    # Fetched without the lock held; two workers may race on a new host,
+    # which only costs a duplicate robots.txt download.
     robots_url = f"{key}/robots.txt"
     rp = RobotFileParser()
     rp.set_url(robots_url)
+    ttl = _ROBOTS_TTL
     try:
         robots_text = _fetch_robots_via_cache(robots_url)
         if robots_text is None:
             rp.allow_all = True
+            ttl = _ROBOTS_NEGATIVE_TTL
         else:
             rp.parse(robots_text.splitlines())
     except Exception:
         rp.allow_all = True
-    _ROBOTS_CACHE[key] = rp
-    return rp
-
+        ttl = _ROBOTS_NEGATIVE_TTL
 
-def _has_agent_rule(rp, agent):
-    agent_lower = agent.lower()
-    for entry in getattr(rp, "entries", []):
-        for ua in entry.useragents:
-            if ua.lower() == agent_lower:
-                return True
-    return False
+    rules = _RobotRules.from_parser(rp, _get_user_agent())
+    with _ROBOTS_LOCK:
+        _ROBOTS_CACHE[key] = (rules, now + ttl)
+        _ROBOTS_CACHE.move_to_end(key)
+        while len(_ROBOTS_CACHE) > _ROBOTS_MAX:
+            _ROBOTS_CACHE.popitem(last=False)
+    return rules
 
 
 def _get_cache_server():
@@ -142,7 +307,8 @@ def _fetch_robots_via_cache(robots_url):
     resp = download(robots_url, temp_config, logger=None)
     if not resp or resp.status != 200 or not resp.raw_response:
         return None
-    return resp.raw_response.text
+    content = resp.raw_response.content or b""
+    return content[:_ROBOTS_MAX_BYTES].decode("utf-8", "replace")
 
 
 def retrieve_text(url, resp):
@@ -172,13 +338,7 @@ def retrieve_text(url, resp):
         logger.debug("retrieve_text: empty content for %s", url)
         return None
 
-    charset_match = re.search(r"charset=([A-Za-z0-9_\-]+)", content_type, re.IGNORECASE)
-    encoding = charset_match.group(1) if charset_match else None
-    if not encoding:
-        encoding = getattr(resp.raw_response, "encoding", None)
-    if not encoding:
-        encoding = "utf-8"
-
+    encoding = _response_encoding(resp)
     try:
         page_text = raw_bytes.decode(encoding, errors="replace")
     except Exception:
@@ -190,97 +350,285 @@ def retrieve_text(url, resp):
     return page_text
 
 
-def store_document(url, text, resp=None, source=None, base_dir="./data/raw", max_bytes=100 * 1024 * 1024):
-    """Store a single scraped item as JSONL (gzipped) with rotation."""
+def _response_encoding(resp):
+    """Charset of the response body, defaulting to utf-8."""
+    headers = getattr(resp.raw_response, "headers", {}) or {}
+    content_type = headers.get("Content-Type", "") or headers.get("content-type", "")
+    _, _, charset = content_type.lower().partition("charset=")
+    encoding = charset.split(";", 1)[0].strip().strip("\"'")
+    if not encoding:
+        encoding = getattr(resp.raw_response, "encoding", None)
+    return encoding or "utf-8"
+
+
+def store_document(url, text, resp=None, source=None, base_dir="./data/raw", max_bytes=100 * 1024 * 1024,
+                   parsed=None):
+    """Queue a single scraped item to be stored as JSONL (gzipped) with rotation."""
     if not url or text is None:
         return None
     if source is None:
-        parsed = urlparse(url)
+        if parsed is None:
+            parsed = urlparse(url)
         source = parsed.netloc or "unknown"
     status = getattr(resp, "status", None)
     record = {
         "url": url,
-        "fetched_at": _dt.datetime.utcnow().isoformat() + "Z",
+        "fetched_at": _now_iso(),
         "status": status if isinstance(status, int) else None,
         "source": source,
         "data": {"text": text},
     }
-    return store_records([record], base_dir=base_dir, max_bytes=max_bytes)
+    _start_writer()
+    _record_queue.put((record, base_dir, max_bytes))
+
+
+def _start_writer():
+    global _writer_thread
+    if _writer_thread is None:
+        with _writer_lock:
+            if _writer_thread is None:
+                _writer_thread = Thread(target=_write_records, daemon=True)
+                _writer_thread.start()
+                # Registered after _close_parts, so it runs first at exit.
+                atexit.register(_record_queue.join)
+
+
+def _write_records():
+    """Write queued records in batches off the crawler threads."""
+    while True:
+        batch = [_record_queue.get()]
+        while len(batch) < _WRITE_BATCH:
+            try:
+                batch.append(_record_queue.get_nowait())
+            except Empty:
+                break
+        # store_records writes one source per call.
+        groups = {}
+        for record, base_dir, max_bytes in batch:
+            key = (base_dir, max_bytes, record.get("source", "unknown"))
+            groups.setdefault(key, []).append(record)
+        try:
+            for (base_dir, max_bytes, _), records in groups.items():
+                store_records(records, base_dir=base_dir, max_bytes=max_bytes)
+        except Exception as e:
+            print(f"Warning: Could not store {len(batch)} records: {e}")
+        finally:
+            for _ in batch:
+                _record_queue.task_done()
 
 
 def store_records(records, base_dir="./data/raw", max_bytes=100 * 1024 * 1024):
     """Append records to a .jsonl.gz file with rotation by size."""
     if not records:
         return None
-    date_str = _dt.datetime.utcnow().date().isoformat()
+    date_str = _now_iso()[:10]
     source = records[0].get("source", "unknown")
-    target_dir = os.path.join(base_dir, f"source={source}", f"dt={date_str}")
-    os.makedirs(target_dir, exist_ok=True)
+    source_dir = os.path.join(base_dir, f"source={source}")
+    target_dir = os.path.join(source_dir, f"dt={date_str}")
+
+    with _PARTS_LOCK:
+        part = _PARTS.get(source_dir)
+        if part is None or part.target_dir != target_dir:
+            # First write for this source today: start a new part, since
+            # the last one may end in a member torn by an earlier crash.
+            if part is not None:
+                part.close()
+            os.makedirs(target_dir, exist_ok=True)
+            part = _PartFile(target_dir, _next_part_index(target_dir))
+            _PARTS[source_dir] = part
+        elif part.size() >= max_bytes:
+            part.close()
+            part = _PartFile(target_dir, part.part_idx + 1)
+            _PARTS[source_dir] = part
 
-    part_idx = _next_part_index(target_dir, max_bytes)
-    filename = f"part-{part_idx:05d}.jsonl.gz"
-    file_path = os.path.join(target_dir, filename)
-
-    with gzip.open(file_path, "ab") as gz:
         for record in records:
-            normalized = _normalize_record(record)
-            line = json.dumps(normalized, ensure_ascii=False)
-            gz.write((line + "\n").encode("utf-8"))
-    return file_path
+            part.write(_json_line(_normalize_record(record)))
+        part.unflushed += len(records)
+        if part.unflushed >= _PART_FLUSH_EVERY:
+            part.close()
+            _OPEN_PARTS.pop(source_dir, None)
+        else:
+            _OPEN_PARTS[source_dir] = part
+            _OPEN_PARTS.move_to_end(source_dir)
+            if len(_OPEN_PARTS) > _MAX_OPEN_PARTS:
+                _OPEN_PARTS.popitem(last=False)[1].close()
+        return part.path
+
+
+class _PartFile:
+    """A part-NNNNN.jsonl.gz file appended to one gzip member at a time."""
+
+    def __init__(self, target_dir, part_idx):
+        self.target_dir = target_dir
+        self.part_idx = part_idx
+        self.path = os.path.join(target_dir, f"part-{part_idx:05d}.jsonl.gz")
+        self.gz = None
+        self.closed_size = 0
+        self.unflushed = 0
+
+    def write(self, data):
+        if self.gz is None:
+            # Level 1 deflate: a little larger on disk, much cheaper to write.
+            self.gz = gzip.open(self.path, "ab", compresslevel=1)
+        self.gz.write(data)
+
+    def size(self):
+        # Compressed bytes in the file so far, tracked without a stat while
+        # a member is open.
+        if self.gz is None:
+            return self.closed_size
+        return self.gz.fileobj.tell()
+
+    def close(self):
+        # Ends the current member; the next write starts a new one.
+        if self.gz is not None:
+            self.gz.close()
+            self.gz = None
+            self.closed_size = os.path.getsize(self.path)
+        self.unflushed = 0
+
+
+def _close_parts():
+    with _PARTS_LOCK:
+        for part in _PARTS.values():
+            part.close()
+        _PARTS.clear()
+        _OPEN_PARTS.clear()
+
+
+atexit.register(_close_parts)
+
+
+def _json_line(record):
+    """Serialize a record to one UTF-8 JSON line, with orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(record) + b"\n"
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
 
 
 def _normalize_record(record):
     required = {
         "url": "",
-        "fetched_at": _dt.datetime.utcnow().isoformat() + "Z",
+        "fetched_at": None,
         "status": None,
         "source": "unknown",
         "data": {},
     }
     normalized = dict(required)
     normalized.update(record or {})
+    if normalized["fetched_at"] is None:
+        normalized["fetched_at"] = _now_iso()
     return normalized
 
 
-def _next_part_index(target_dir, max_bytes):
+# (second, timestamp) of the last _now_iso call; swapped as a whole, so
+# threads never see a mismatched pair.
+_now_cache = (None, "")
+
+
+def _now_iso():
+    """Current UTC time as an ISO 8601 string, recomputed once a second."""
+    global _now_cache
+    now = int(time.time())
+    second, stamp = _now_cache
+    if second != now:
+        stamp = _dt.datetime.fromtimestamp(now, _dt.timezone.utc).strftime(
+            "%Y-%m-%dT%H:%M:%SZ")
+        _now_cache = (now, stamp)
+    return stamp
+
+
+def _next_part_index(target_dir):
+    # Only called when a source first writes to a directory; after that the
+    # _PartFile tracks its index and size.
     max_idx = -1
-    current_path = None
-    for name in os.listdir(target_dir):
-        if not name.startswith("part-") or not name.endswith(".jsonl.gz"):
-            continue
+    with os.scandir(target_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            if not name.startswith("part-") or not name.endswith(".jsonl.gz"):
+                continue
+            try:
+                idx = int(name[len("part-"):len("part-") + 5])
+            except ValueError:
+                continue
+            if idx > max_idx:
+                max_idx = idx
+    return max_idx + 1
+
+
+class _LinkCollector:
+    """lxml parser target that keeps only the href of each <a> tag.
+
+    Parse events go straight to the target, so no element tree is built.
+    """
+
+    def __init__(self):
+        self.hrefs = []
+
+    def start(self, tag, attrib):
+        if tag == "a":
+            href = attrib.get("href")
+            if href:
+                self.hrefs.append(href)
+
+    def end(self, tag):
+        pass
+
+    def data(self, data):
+        pass
+
+    def close(self):
+        hrefs, self.hrefs = self.hrefs, []
+        return hrefs
+
+
+# lxml parsers are not thread-safe, so each thread keeps its own link
+# parser per charset: encoding -> (parser, collector).
+_link_parsers = local()
+
+
+def _extract_hrefs(data, encoding="utf-8"):
+    """Return the href of every <a> tag in raw page bytes."""
+    parsers = getattr(_link_parsers, "by_encoding", None)
+    if parsers is None:
+        parsers = _link_parsers.by_encoding = {}
+    cached = parsers.get(encoding)
+    if cached is None:
+        collector = _LinkCollector()
         try:
-            idx = int(name[len("part-"):len("part-") + 5])
-        except ValueError:
-            continue
-        if idx > max_idx:
-            max_idx = idx
-            current_path = os.path.join(target_dir, name)
-
-    if max_idx == -1:
-        return 0
-    if current_path and os.path.getsize(current_path) >= max_bytes:
-        return max_idx + 1
-    return max_idx
+            parser = etree.HTMLParser(
+                target=collector, encoding=encoding, recover=True)
+        except LookupError:
+            # libxml2 does not know the charset; decode it in Python instead.
+            try:
+                data = data.decode(encoding, "replace").encode("utf-8")
+            except LookupError:
+                pass
+            return _extract_hrefs(data)
+        cached = parsers[encoding] = (parser, collector)
+    parser, collector = cached
+    # Drop anything left over from a parse that raised.
+    collector.hrefs = []
+    try:
+        return etree.fromstring(data, parser)
+    except etree.LxmlError:
+        # Nothing parseable, e.g. an empty document.
+        return []
 
 
-def parse_text_for_links(base_url, text):
-    """Parse outgoing links from page text."""
+def parse_text_for_links(base_url, text, encoding=None):
+    """Parse outgoing links from page text or raw page bytes."""
     if text is None:
         return []
     if isinstance(text, bytes):
-        try:
-            text = text.decode("utf-8", errors="replace")
-        except Exception:
-            return []
-
-    try:
-        soup = BeautifulSoup(text, "lxml")
-    except Exception:
-        soup = BeautifulSoup(text, "html.parser")
-    hrefs = [a.get("href") for a in soup.find_all("a") if a.get("href")]
+        data = text
+        encoding = encoding or "utf-8"
+    else:
+        data = text.encode("utf-8", "replace")
+        encoding = "utf-8"
 
     absolute_links = []
-    for href in hrefs:
+    for href in dict.fromkeys(_extract_hrefs(data, encoding)):
         cleaned = href.strip()
         if not cleaned:
             continue
@@ -289,36 +637,28 @@ def parse_text_for_links(base_url, text):
             continue
         if cleaned.startswith("#"):
             continue
-        # Convert to absolute URL and defragment (remove #fragment)
-        absolute_url = urljoin(base_url, cleaned)
-        defragged_url, _ = urldefrag(absolute_url)
-        absolute_links.append(defragged_url)
+        # Drop the #fragment, then convert to an absolute URL; the joined
+        # url cannot gain a fragment, so it needs no separate urldefrag.
+        absolute_links.append(urljoin(base_url, cleaned.split("#", 1)[0]))
     return absolute_links
 
 
+@lru_cache(maxsize=65536)
 def is_valid(url):
     # Decide whether to crawl this url or not. 
     # If you decide to crawl it, return True; otherwise return False.
     # There are already some conditions that return False.
-    allowed_domains = r".*\.(ics|cs|informatics|stat)\.uci\.edu$"
     try:
         parsed = urlparse(url)
         # make sure its http or https links
-        if parsed.scheme not in set(["http", "https"]):
+        if parsed.scheme not in ("http", "https"):
             return False
-        if not re.match(allowed_domains, parsed.netloc.lower()):
+        if not _ALLOWED_NETLOC_RE.match(parsed.netloc.lower()):
             return False
-        if is_trap(url):
+        if _is_trap(url, parsed):
             return False
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
+        ext = parsed.path.rsplit(".", 1)
+        return len(ext) != 2 or ext[1].lower() not in _DISALLOWED_EXTS
 
     except TypeError:
         print("TypeError for ", parsed)
@@ -326,8 +666,13 @@ def is_valid(url):
 
 
 
+@lru_cache(maxsize=65536)
 def is_trap(url: str) -> bool:
-    parsed = urlparse(url)
+    return _is_trap(url, urlparse(url))
+
+
+def _is_trap(url, parsed):
+    # is_trap for a url that has already been split by urlparse.
     path_lower = (parsed.path or "").lower()
 
     # Overly long or deeply nested URLs
@@ -338,111 +683,53 @@ def is_trap(url: str) -> bool:
 
     # Calendar traps and suspicious dates
     current_year = _dt.datetime.utcnow().year
-    date_patterns = [
-        r"/(19|20)\d{2}/\d{1,2}/\d{1,2}/",  # /YYYY/MM/DD/
-        r"/(19|20)\d{2}-\d{1,2}-\d{1,2}/",  # /YYYY-MM-DD/
-        r"[?&](date|day|month|year)=\d{4}[-/]\d{1,2}[-/]\d{1,2}",  # ?date=YYYY-MM-DD
-    ]
-    for pattern in date_patterns:
-        for match in re.finditer(pattern, url):
-            year_match = re.search(r"(19|20)\d{2}", match.group(0))
+    for pattern in _DATE_PATTERNS:
+        for match in pattern.finditer(url):
+            year_match = _YEAR_RE.search(match.group(0))
             if year_match:
                 year_val = int(year_match.group(0))
                 if abs(year_val - current_year) > 3:
                     return True
 
-    # Repeated query parameters or pagination loops
-    query = parse_qs(parsed.query, keep_blank_values=True)
-    for key, values in query.items():
-        if len(values) > 1:
+    # Calendar archive traps (daily, month, list and tag views)
+    if "/calendar/" in path_lower or path_lower.endswith(_EVENT_VIEW_ENDS):
+        return True
+    if "/events/" in path_lower:
+        if any(view in path_lower for view in _EVENT_VIEW_DIRS):
             return True
-    for key in query.keys():
-        key_lower = key.lower()
-        if key_lower in {"page", "p", "start", "offset", "paged"}:
-            if len(query[key]) > 1:
-                return True
-        if key_lower in {"ical", "outlook-ical", "icalendar", "format"}:
+        if _EVENT_TRAP_RE.search(path_lower):
             return True
 
-    # Session or tracking IDs
-    tracking_keys = {
-        "sessionid", "sid", "phpsessid", "jsessionid", "ref",
-        "utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content",
-        "gclid", "fbclid",
-    }
-    for key in query.keys():
-        if key.lower() in tracking_keys:
-            return True
-
-    # Calendar archive traps (daily pages)
-    if re.search(r"/events/\d{4}-\d{2}-\d{2}$", path_lower):
-        return True
-    if re.search(r"/events/.*/day/\d{4}-\d{2}-\d{2}", path_lower):
-        return True
-    if re.search(r"/calendar/|/events/[^/]+/day/\d{4}-\d{2}-\d{2}", path_lower):
-        return True
-    if re.search(r"/events/today/?$", path_lower):
+    # DokuWiki media endpoints
+    if any(page in path_lower for page in _LIB_EXE_PAGES):
         return True
+    is_doku = "/doku.php" in path_lower
 
-    # Calendar archive traps (month/list/tag views)
-    if re.search(r"/events/month(/|$)", path_lower):
-        return True
-    if re.search(r"/events/month/\d{4}-\d{2}", path_lower):
-        return True
-    if re.search(r"/events/list(/|$)", path_lower):
-        return True
-    if re.search(r"/events/list/page/\d+(/|$)", path_lower):
-        return True
-    if re.search(r"/events/tag/[^/]+/\d{4}-\d{2}$", path_lower):
-        return True
-    if re.search(r"/events/tag/[^/]+/list(/|$)", path_lower):
-        return True
-    if re.search(r"/events/tag/[^/]+/list/page/\d+(/|$)", path_lower):
-        return True
+    # Query parameters, all checked in one pass
+    seen_keys = set()
+    for key, value in parse_qsl(parsed.query, keep_blank_values=True):
+        # Repeated query parameters or pagination loops
+        if key in seen_keys:
+            return True
+        seen_keys.add(key)
 
-    # Trap-like query parameter names common in calendars/feeds
-    for key in query.keys():
+        # Calendar/feed/media parameter names, session or tracking IDs
         key_lower = key.lower()
-        if re.search(r"(calendar|ical|feed|rss|atom)", key_lower):
+        if key_lower in _TRAP_QUERY_KEYS or _TRAP_QUERY_KEY_RE.search(key_lower):
             return True
-        if key_lower in {"tribe-bar-date", "eventdisplay", "tribe_event", "eventdate"}:
+        # DokuWiki navigation/revision traps (this includes any do=...)
+        if is_doku and key_lower in _DOKU_TRAP_KEYS:
             return True
-        if "date" in key_lower or "event" in key_lower or "tribe" in key_lower:
-            for value in query.get(key, []):
-                if re.search(r"\d{4}-\d{2}-\d{2}", value):
-                    return True
 
-    # DokuWiki navigation/revision traps and media endpoints
-    if "/doku.php" in path_lower:
-        doku_query_keys = {k.lower() for k in query.keys()}
-        doku_trap_keys = {
-            "do", "idx", "rev", "rev2", "difftype", "sectok",
-            "tab_files", "tab_details",
-        }
-        if doku_query_keys & doku_trap_keys:
+        if value.lower().endswith(_IMAGE_EXTS):
             return True
-        do_values = [v.lower() for v in query.get("do", [])]
-        doku_trap_do_values = {
-            "edit", "index", "recent", "backlink", "diff", "revisions", "media"
-        }
-        if any(v in doku_trap_do_values for v in do_values):
-            return True
-    if re.search(r"/lib/exe/(fetch|detail)\.php", path_lower):
-        return True
-    media_query_keys = {"image", "media", "tab_files", "tab_details", "sectok"}
-    if any(k.lower() in media_query_keys for k in query.keys()):
-        return True
-    image_exts = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".bmp", ".ico", ".tiff")
-    for values in query.values():
-        for value in values:
-            if value.lower().endswith(image_exts):
+        if "date" in key_lower or "event" in key_lower or "tribe" in key_lower:
+            if _ISO_DATE_RE.search(value):
+                return True
+        # Excessively large numeric pagination values
+        if key_lower in _LARGE_PAGINATION_KEYS:
+            # isdecimal, not isdigit: int() rejects digits like "\u00b2".
+            if value.isdecimal() and int(value) > 1000:
                 return True
-
-    # Excessively large numeric pagination values
-    for key, values in query.items():
-        if key.lower() in {"page", "p", "start", "offset"}:
-            for value in values:
-                if value.isdigit() and int(value) > 1000:
-                    return True
 
     return False
@@ -1,102 +1,202 @@
+import atexit
+import json
+import os
 import re
 import hashlib
-from threading import RLock
+from collections import Counter, defaultdict
+from functools import lru_cache
+from threading import Lock, RLock
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import mmh3
+except ImportError:
+    mmh3 = None
+
+# Alphanumeric runs of lowercased UTF-8 text
+_WORD_RE = re.compile(rb'[a-z0-9]+')
+
+# Which word hash _word_digest uses; saved fingerprints are only comparable
+# with ones built by the same hash.
+_WORD_HASH = 'xxh64' if xxhash is not None else 'mmh3' if mmh3 is not None else 'blake2b'
+
+# Saved state is appended to these files in save_dir, and flushed every
+# _SAVE_FLUSH_EVERY new pages and at exit.
+_META_FILE = "meta.json"
+_SIMHASH_FILE = "simhashes.u64"
+_EXACT_FILE = "exact_hashes.bin"
+_URL_FILE = "urls.txt"
+_SAVE_FLUSH_EVERY = 64
+
+
+@lru_cache(maxsize=200_000)
+def _word_digest(word):
+    """
+    64-bit hash of a word (bytes), cached since a crawl's vocabulary is small.
+
+    Uses a non-cryptographic hash built for short keys when one is installed
+    (xxHash64, else the first half of MurmurHash3 x64-128), else BLAKE2b.
+    """
+    if xxhash is not None:
+        return xxhash.xxh64_intdigest(word)
+    if mmh3 is not None:
+        return mmh3.hash64(word, signed=False)[0]
+    h = hashlib.blake2b(word, digest_size=8).digest()
+    return int.from_bytes(h, byteorder='big')
+
+
+def _simhash_loop(hashes, freqs, hash_bits):
+    """Simhash of parallel word hash / frequency arrays, as plain loops."""
+    vector = np.zeros(hash_bits, dtype=np.int64)
+    one = np.uint64(1)
+    for w in range(hashes.size):
+        word_hash = hashes[w]
+        freq = freqs[w]
+        for i in range(hash_bits):
+            if (word_hash >> np.uint64(i)) & one:
+                vector[i] += freq
+            else:
+                vector[i] -= freq
+    simhash = np.uint64(0)
+    for i in range(hash_bits):
+        if vector[i] > 0:
+            simhash |= one << np.uint64(i)
+    return simhash
+
+
+# Compiled with numba when it is installed; the loops are only worth running
+# as native code, otherwise _compute_simhash uses the NumPy path.
+_simhash_jit = njit(cache=True)(_simhash_loop) if njit is not None else None
+
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0f0f0f0f0f0f0f0f)
+_H01 = np.uint64(0x0101010101010101)
+
+
+def _popcount64_swar(values):
+    """Number of set bits in each element of a uint64 array (SWAR)."""
+    values = values - ((values >> np.uint64(1)) & _M1)
+    values = (values & _M2) + ((values >> np.uint64(2)) & _M2)
+    values = (values + (values >> np.uint64(4))) & _M4
+    return (values * _H01) >> np.uint64(56)
+
+
+# NumPy 2.0+ counts bits with the CPU's popcount instruction
+_popcount64 = getattr(np, 'bitwise_count', _popcount64_swar)
 
 
 class SimilarityTracker:    
-    def __init__(self, exact_threshold=1.0, near_threshold=0.88, hash_bits=64):
+    def __init__(self, exact_threshold=1.0, near_threshold=0.88, hash_bits=64,
+                 save_dir=None, restart=False):
         """
         Args:
             exact_threshold: Exact match threshold (1.0 = 100%)
             near_threshold: Simhash similarity threshold (0-1)
                            0.88 = 88% bit similarity = near-duplicate
-            hash_bits: Number of bits in simhash fingerprint (default 64)
+            hash_bits: Number of bits in simhash fingerprint (default 64, max 64)
+            save_dir: Directory to persist seen pages in, so a resumed crawl
+                      still recognizes them (None = keep them in memory only)
+            restart: Discard any pages saved in save_dir
         """
-        self.url_exact_hashes = {}     
-        self.url_simhashes = {}         
+        self.exact_hashes = set()
         self.exact_threshold = exact_threshold
         self.near_threshold = near_threshold
         self.hash_bits = hash_bits
+        self._hash_mask = (1 << hash_bits) - 1
+        self._bit_shifts = np.arange(hash_bits, dtype=np.uint64)
+        # Largest bit distance d that still counts as near-duplicate, i.e.
+        # (hash_bits - d) / hash_bits >= near_threshold
+        self._max_distance = max(
+            (d for d in range(hash_bits + 1)
+             if (hash_bits - d) / hash_bits >= near_threshold), default=-1)
+        # Stored fingerprints, contiguous so a page is compared against all
+        # of them in one vectorized pass; grown by doubling.
+        self._simhashes = np.empty(1024, dtype=np.uint64)
+        self._simhash_count = 0
+        # Urls of the stored pages
+        self._stored_urls = set()
+        # LSH index: the fingerprint is cut into max_distance + 1 bands, and
+        # each band maps its value to the indices of stored fingerprints with
+        # that value. Two fingerprints within max_distance bits must agree on
+        # at least one band, so only pages sharing a band need comparing.
+        band_count = min(self._max_distance + 1, hash_bits)
+        edges = [hash_bits * b // band_count for b in range(band_count + 1)] if band_count > 0 else []
+        self._band_slices = [(start, (1 << (end - start)) - 1)
+                             for start, end in zip(edges, edges[1:])]
+        self._bands = [defaultdict(list) for _ in self._band_slices]
         self.lock = RLock()
+        
+        self.save_dir = save_dir
+        self._save_files = None
+        self._unflushed = 0
+        if save_dir is not None:
+            self._open_save_files(restart)
     
-    def _compute_exact_hash(self, text):
+    def _compute_exact_hash(self, data):
         """
-        Compute exact MD5 hash of text for 100% duplicate detection.
+        Compute exact BLAKE2b hash of UTF-8 text for 100% duplicate detection.
         
-        Returns: Hexadecimal hash string
+        Returns: 16-byte digest
         """
-        return hashlib.md5(text.encode()).hexdigest()
+        return hashlib.blake2b(data, digest_size=16).digest()
 
     def _get_word_hash(self, word):
         """
-        Generate a b-bit hash for a word using MD5.
+        Generate a b-bit hash for a word (bytes) from its 64-bit digest.
         
         Returns an integer with b bits set according to the word's hash.
         """
-        h = hashlib.md5(word.encode()).digest()
-        hash_int = int.from_bytes(h[:8], byteorder='big')
-        return hash_int & ((1 << self.hash_bits) - 1)
+        return _word_digest(word) & self._hash_mask
 
-    def _extract_words(self, text):
+    def _extract_words(self, data):
         """
-        Extract words from text with their frequencies.
+        Extract words from UTF-8 text with their frequencies.
         
-        Returns a dictionary of {word: frequency}
+        Returns: Tuple (words, freqs) of the distinct words (bytes) and a
+                 parallel int64 array of how often each occurs
         """
-        if not text:
-            return {}
-        
-        # Extract alphanumeric sequences
-        words = re.findall(r'\b[a-z0-9]\b', text.lower())
-        
-        word_freqs = {}
-        for word in words:
-            word_freqs[word] = word_freqs.get(word, 0) + 1
+        if not data:
+            return [], np.zeros(0, dtype=np.int64)
         
-        return word_freqs
+        # Extract alphanumeric sequences (the old \b[a-z0-9]\b pattern only
+        # ever matched single characters). Only ASCII letters can be part of
+        # a word, so lowercasing the bytes is enough.
+        word_freqs = Counter(_WORD_RE.findall(data.lower()))
+        freqs = np.fromiter(word_freqs.values(), dtype=np.int64, count=len(word_freqs))
+        return list(word_freqs), freqs
 
-    def _compute_simhash(self, text):
+    def _compute_simhash(self, data):
         """
-        Compute Simhash fingerprint for text using word frequencies.
+        Compute Simhash fingerprint for UTF-8 text using word frequencies.
 
         Returns an integer representing the b-bit fingerprint.
         """
-        word_freqs = self._extract_words(text)
-        
-        vector = [0] * self.hash_bits
-        
-        for word, freq in word_freqs.items():
-            word_hash = self._get_word_hash(word)
-            
-            for i in range(self.hash_bits):
-                bit = (word_hash >> i) & 1
-                
-                if bit == 1:
-                    vector[i] += freq  
-                else:
-                    vector[i] -= freq  
+        words, freqs = self._extract_words(data)
+        hashes = np.fromiter(
+            map(self._get_word_hash, words), dtype=np.uint64, count=len(words))
+        if _simhash_jit is not None:
+            return int(_simhash_jit(hashes, freqs, self.hash_bits))
         
-        simhash = 0
-        for i in range(self.hash_bits):
-            if vector[i] > 0:
-                simhash |= (1 << i)  
+        # One row per word: +1 where its hash has the bit set, -1 where not
+        bits = ((hashes[:, None] >> self._bit_shifts) & np.uint64(1)).astype(np.int8)
+        vector = freqs @ (bits * 2 - 1)
         
-        return simhash
-
-    def _hamming_similarity(self, hash1, hash2):
-        """
-        Calculate similarity as fraction of matching bits.
-        
-        Returns: Similarity score from 0.0 to 1.0
-        """
-        xor = hash1 ^ hash2
-        
-        hamming_distance = bin(xor).count('1')
-        
-        matching_bits = self.hash_bits - hamming_distance
-        similarity = matching_bits / self.hash_bits
-        
-        return similarity
+        # The set bits are distinct, so summing them is the same as OR-ing
+        simhash = ((vector > 0).astype(np.uint64) << self._bit_shifts).sum()
+        return int(simhash)
 
     def is_similar(self, url, page_text):
         """
@@ -106,28 +206,153 @@ class SimilarityTracker:
             Tuple: (is_similar: bool, detection_method: str)
             - (True, 'exact') if exact duplicate found
             - (True, 'near') if near-duplicate found
-            - (False, 'new') if page is new
+            - (False, 'new') if page is new, or is a page already stored
+              under the same url (e.g. refetched after a crash)
         """
         if not page_text:# or len(page_text.strip()) < 50:
             return False, 'new'
+        if url in self._stored_urls:
+            # Its own fingerprint would match, so it is not a duplicate
+            return False, 'new'
         
-        exact_hash = self._compute_exact_hash(page_text)
-        simhash = self._compute_simhash(page_text)
+        # Hashing and most of the lookup run without the lock. The stored
+        # set, array and bands are only ever appended to, and each entry is
+        # complete before _simhash_count covers it, so the first `seen`
+        # fingerprints can be read while other threads add more. The page is
+        # encoded once and both hashes work on the same bytes.
+        data = page_text.encode('utf-8', 'replace')
+        exact_hash = self._compute_exact_hash(data)
+        if exact_hash in self.exact_hashes:
+            return True, 'exact'
+        simhash = self._compute_simhash(data)
+        seen = self._simhash_count
+        if self._is_near_duplicate(simhash, seen):
+            return True, 'near'
         
         with self.lock:
-            for stored_url, stored_exact_hash in self.url_exact_hashes.items():
-                if exact_hash == stored_exact_hash:
-                    return True, 'exact'
-            
-            for stored_url, stored_simhash in self.url_simhashes.items():
-                similarity = self._hamming_similarity(simhash, stored_simhash)
-                if similarity >= self.near_threshold:
-                    return True, 'near'
+            # Only pages stored since the lookup above still need checking
+            if exact_hash in self.exact_hashes:
+                return True, 'exact'
+            recent = self._simhashes[seen:self._simhash_count]
+            if (_popcount64(recent ^ np.uint64(simhash)) <= self._max_distance).any():
+                return True, 'near'
             
-            self.url_exact_hashes[url] = exact_hash
-            self.url_simhashes[url] = simhash
+            self.exact_hashes.add(exact_hash)
+            self._add_simhash(url, simhash)
+            if self._save_files is not None:
+                self._save_page(url, exact_hash, simhash)
             return False, 'new'
 
+    def _is_near_duplicate(self, simhash, limit):
+        """Whether one of the first `limit` stored fingerprints is within max_distance bits."""
+        if self._max_distance < 0 or not limit:
+            return False
+        if self._max_distance >= self.hash_bits:
+            # Every fingerprint is within range of every other
+            return True
+        candidates = set()
+        for (start, mask), band in zip(self._band_slices, self._bands):
+            candidates.update(band.get((simhash >> start) & mask, ()))
+        if not candidates:
+            return False
+        index = np.fromiter(candidates, dtype=np.intp, count=len(candidates))
+        # Bands may already list fingerprints stored after `limit`
+        index = index[index < limit]
+        distances = _popcount64(self._simhashes[index] ^ np.uint64(simhash))
+        return bool((distances <= self._max_distance).any())
+
+    def _add_simhash(self, url, simhash):
+        """Append a fingerprint to the stored array and LSH bands (caller holds the lock)."""
+        for (start, mask), band in zip(self._band_slices, self._bands):
+            band[(simhash >> start) & mask].append(self._simhash_count)
+        if self._simhash_count == len(self._simhashes):
+            grown = np.empty(2 * len(self._simhashes), dtype=np.uint64)
+            grown[:self._simhash_count] = self._simhashes
+            self._simhashes = grown
+        self._simhashes[self._simhash_count] = simhash
+        self._stored_urls.add(url)
+        self._simhash_count += 1
+
+    def _open_save_files(self, restart):
+        """Load pages saved by an earlier run and open the files for appending."""
+        os.makedirs(self.save_dir, exist_ok=True)
+        meta = {'hash_bits': self.hash_bits, 'word_hash': _WORD_HASH}
+        meta_path = os.path.join(self.save_dir, _META_FILE)
+        if not restart and os.path.exists(meta_path):
+            try:
+                with open(meta_path) as f:
+                    saved_meta = json.load(f)
+            except (OSError, ValueError):
+                saved_meta = None
+            if saved_meta == meta:
+                self._load_saved_pages()
+            else:
+                print(f"Warning: Similarity data in {self.save_dir} was built "
+                      f"with different hashing, starting fresh.")
+                restart = True
+        if restart:
+            for name in (_SIMHASH_FILE, _EXACT_FILE, _URL_FILE):
+                path = os.path.join(self.save_dir, name)
+                if os.path.exists(path):
+                    os.remove(path)
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+        
+        self._save_files = tuple(
+            open(os.path.join(self.save_dir, name), 'ab')
+            for name in (_SIMHASH_FILE, _EXACT_FILE, _URL_FILE))
+        atexit.register(self.flush)
+
+    def _load_saved_pages(self):
+        """Rebuild the tracker from the save files, dropping torn records."""
+        def read(name):
+            path = os.path.join(self.save_dir, name)
+            if not os.path.exists(path):
+                return b''
+            with open(path, 'rb') as f:
+                return f.read()
+        
+        simhash_data = read(_SIMHASH_FILE)
+        exact_data = read(_EXACT_FILE)
+        url_lines = read(_URL_FILE).split(b'\n')[:-1]  # last one is incomplete
+        
+        # The files are flushed independently, so a crash can leave them
+        # with different numbers of records; keep what is complete in both.
+        count = min(len(simhash_data) // 8, len(url_lines))
+        simhashes = np.frombuffer(simhash_data, dtype='<u8', count=count)
+        for url, simhash in zip(url_lines, simhashes.tolist()):
+            self._add_simhash(url.decode('utf-8', 'replace'), simhash)
+        exact_size = len(exact_data) // 16 * 16
+        self.exact_hashes.update(
+            exact_data[i:i + 16] for i in range(0, exact_size, 16))
+        
+        # Cut off partial records so new ones are appended in step
+        url_size = sum(len(line) + 1 for line in url_lines[:count])
+        for name, size in ((_SIMHASH_FILE, count * 8),
+                           (_EXACT_FILE, exact_size), (_URL_FILE, url_size)):
+            path = os.path.join(self.save_dir, name)
+            if os.path.exists(path):
+                os.truncate(path, size)
+
+    def _save_page(self, url, exact_hash, simhash):
+        """Append a new page to the save files (caller holds the lock)."""
+        simhash_file, exact_file, url_file = self._save_files
+        simhash_file.write(simhash.to_bytes(8, 'little'))
+        exact_file.write(exact_hash)
+        url_file.write(url.encode('utf-8', 'replace') + b'\n')
+        self._unflushed += 1
+        if self._unflushed >= _SAVE_FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        """Write buffered pages to the save files."""
+        with self.lock:
+            if self._save_files is None:
+                return
+            for f in self._save_files:
+                f.flush()
+            self._unflushed = 0
+
     def get_stats(self):
         """
         Return statistics about tracked pages and duplicates detected.
@@ -136,8 +361,30 @@ class SimilarityTracker:
         """
         with self.lock:
             return {
-                'unique_pages': len(self.url_simhashes),
+                'unique_pages': self._simhash_count,
                 'exact_threshold': self.exact_threshold,
                 'near_threshold': self.near_threshold,
                 'hash_bits': self.hash_bits
-            }
\ No newline at end of file
+            }
+
+
+# Global tracker instance shared by all workers (singleton pattern)
+_tracker_instance = None
+_tracker_lock = Lock()
+
+
+def get_similarity_tracker(save_dir="similarity_data", restart=False):
+    """
+    Get the global similarity tracker (thread-safe singleton).
+
+    The arguments only apply to the call that creates the tracker, so the
+    launcher calls this first with the --restart flag.
+    """
+    global _tracker_instance
+    if _tracker_instance is None:
+        with _tracker_lock:
+            if _tracker_instance is None:
+                _tracker_instance = SimilarityTracker(
+                    exact_threshold=1.0, near_threshold=0.88,
+                    save_dir=save_dir, restart=restart)
+    return _tracker_instance
@@ -0,0 +1,44 @@
+import unittest
+from urllib.robotparser import RobotFileParser
+
+from scraper import _RobotRules, _get_user_agent
+
+
+def _rules_for(lines):
+    rp = RobotFileParser()
+    rp.parse(lines)
+    return _RobotRules.from_parser(rp, _get_user_agent())
+
+
+class RobotRulesTest(unittest.TestCase):
+    def test_star_group_applies_when_no_group_names_us(self):
+        rules = _rules_for([
+            "User-agent: *",
+            "Disallow: /private",
+        ])
+        self.assertIsNotNone(rules)
+        self.assertFalse(rules.can_fetch("https://www.ics.uci.edu/private/a"))
+        self.assertTrue(rules.can_fetch("https://www.ics.uci.edu/public"))
+
+    def test_own_group_wins_over_star_group(self):
+        rules = _rules_for([
+            "User-agent: *",
+            "Disallow: /",
+            "",
+            f"User-agent: {_get_user_agent()}",
+            "Disallow: /private",
+        ])
+        self.assertFalse(rules.can_fetch("https://www.ics.uci.edu/private/a"))
+        self.assertTrue(rules.can_fetch("https://www.ics.uci.edu/public"))
+
+    def test_first_matching_rule_decides(self):
+        rules = _rules_for([
+            "User-agent: *",
+            "Disallow: /a",
+            "Allow: /a/b",
+        ])
+        self.assertFalse(rules.can_fetch("https://www.ics.uci.edu/a/b/c"))
+
+
+if __name__ == "__main__":
+    unittest.main()